@@ -1,10 +1,21 @@
 import os
 import uuid
-from flask import Flask, redirect, request, session, url_for, render_template
+from flask import Flask, redirect, request, session, url_for, render_template, jsonify, g, Response
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from spotipy.cache_handler import MemoryCacheHandler
 from dotenv import load_dotenv
 from recommender import get_recommendations  
+from artist_cache import ArtistCache
+from spotify_client import MemoizingSpotify, SessionMemo
+from jobs import JobManager, DONE
+from feature_store import FeatureStore
+from catalog_index import CatalogIndex
+from candidate_pool import CandidatePoolStore
+from rate_limit import RateLimiter, RateLimitedSpotify
+import metrics
+from http_session import get_session
+from token_store import create_token_store
 
 
 load_dotenv()
@@ -12,24 +23,157 @@ load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = "replace_this_with_a_secure_random_key"
+# Builds the Spotify client from an access token; the benchmark swaps in a fake.
+# All clients share one pooled keep-alive session with an HTTP cache.
+app.config["SPOTIFY_CLIENT_FACTORY"] = lambda access_token: spotipy.Spotify(
+    auth=access_token, requests_session=get_session()
+)
 
 CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
 SCOPE = "user-top-read"
+CANDIDATE_WORKERS = int(os.getenv("ECHODASH_CANDIDATE_WORKERS", "8"))
+# Requests / recommendation jobs slower than this (seconds) get their stage
+# breakdown logged. 0 turns the slow log off.
+SLOW_REQUEST_SECONDS = float(os.getenv("ECHODASH_SLOW_REQUEST_SECONDS", "2"))
+
+# Artist data is the same for every user, so one cache is shared by all
+# requests in this process and (through the SQLite file) by all workers.
+ARTIST_CACHE = ArtistCache(
+    path=os.getenv("ECHODASH_ARTIST_CACHE_PATH", "artist_cache.sqlite3") or None,
+    ttl=int(os.getenv("ECHODASH_ARTIST_CACHE_TTL", str(24 * 60 * 60))),
+    max_entries=int(os.getenv("ECHODASH_ARTIST_CACHE_SIZE", "5000"))
+)
+# ArtistCache.stats() keys that are sizes; the rest only ever go up.
+ARTIST_CACHE_SIZES = ("entries", "disk_entries", "max_entries")
+
+
+def artist_cache_metrics():
+    stats = ARTIST_CACHE.stats()
+    sizes = {key: stats.pop(key) for key in ARTIST_CACHE_SIZES if key in stats}
+    return (metrics.counters("echodash_artist_cache", "Artist cache events", stats)
+            + metrics.gauges("echodash_artist_cache", "Artist cache size", sizes))
+
+
+metrics.register_collector(artist_cache_metrics)
+metrics.register_collector(
+    lambda: metrics.counters("echodash_http_cache", "Spotify HTTP cache events",
+                             get_session().get_adapter("https://").stats)
+)
+
+# One Retry-After window for the whole process: a 429 seen by any request or
+# recommendation job pauses all of them. Every Spotify call goes through it
+# (see get_spotify).
+# Retry-After windows longer than the max wait (seconds) fail the call instead.
+RATE_LIMITER = RateLimiter(max_wait=float(os.getenv("ECHODASH_MAX_RETRY_WAIT", "30")))
+
+# Audio-feature vectors, memory-mapped and shared by all workers.
+FEATURE_STORE = FeatureStore(os.getenv("ECHODASH_FEATURE_STORE_PATH", "features"))
+if os.getenv("ECHODASH_FEATURE_FILE"):
+    FEATURE_STORE.load_file(os.getenv("ECHODASH_FEATURE_FILE"))
+
+# Every track we've scored, searchable by taste so returning users can skip
+# most of the artist fan-out.
+CATALOG = CatalogIndex(os.getenv("ECHODASH_CATALOG_PATH", "catalog.sqlite3"), FEATURE_STORE)
+
+# Per-user, per-view candidate pools, so repeat visits only expand
+# newly-top artists.
+# A pool is rebuilt from scratch once it is older than the max age.
+CANDIDATE_POOLS = CandidatePoolStore(
+    os.getenv("ECHODASH_POOL_PATH", "candidate_pools.sqlite3"),
+    max_age=int(os.getenv("ECHODASH_POOL_MAX_AGE", str(7 * 24 * 60 * 60)))
+)
+
+# Spotify tokens live server-side; the session cookie only holds session["uuid"].
+TOKEN_STORE = create_token_store(
+    os.getenv("ECHODASH_TOKEN_STORE", "sqlite"),
+    path=os.getenv("ECHODASH_TOKEN_STORE_PATH", "tokens.sqlite3"),
+    ttl=int(os.getenv("ECHODASH_SESSION_TTL", str(30 * 24 * 60 * 60)))
+)
+
+# Optional: let a user's back-to-back page views share Spotify responses for a
+# few seconds. 0 keeps memoization strictly per request.
+SESSION_MEMO_TTL = int(os.getenv("ECHODASH_SESSION_MEMO_TTL", "0"))
+SESSION_MEMO = SessionMemo(ttl=SESSION_MEMO_TTL) if SESSION_MEMO_TTL > 0 else None
+
+# Recommendations are built in the background so the dashboard renders at once.
+REC_JOBS = JobManager(
+    max_workers=int(os.getenv("ECHODASH_REC_WORKERS", "4")),
+    result_ttl=int(os.getenv("ECHODASH_REC_RESULT_TTL", "300"))
+)
+
+
+def get_spotify(token_info):
+    """
+    Spotify client for the current request. Identical read calls made while
+    rendering the page (by the view or the recommender) hit the API once, and
+    every call backs off on 429s through RATE_LIMITER.
+    """
+    if "spotify" not in g:
+        memo = SESSION_MEMO.for_session(session.get("uuid", "")) if SESSION_MEMO else None
+        client = app.config["SPOTIFY_CLIENT_FACTORY"](token_info["access_token"])
+        client = RateLimitedSpotify(metrics.InstrumentedSpotify(client), RATE_LIMITER)
+        g.spotify = MemoizingSpotify(client, memo=memo)
+    return g.spotify
+
+
+def rec_job_key(time_range, limit):
+    return (session.get("uuid", ""), time_range, limit)
+
+
+def start_recommendation_job(sp, time_range, limit, tracks=None, artists=None):
+    """
+    Start (or find) the background recommendation job for this user + view.
+    The top tracks/artists are only fetched here if the caller doesn't have them.
+    """
+    if tracks is None:
+        tracks = sp.current_user_top_tracks(limit=limit, time_range=time_range)["items"]
+    if artists is None:
+        artists = sp.current_user_top_artists(limit=limit, time_range=time_range)["items"]
+    user_id = sp.current_user()["id"]
+    return REC_JOBS.submit(
+        rec_job_key(time_range, limit),
+        metrics.traced("recommendations job", SLOW_REQUEST_SECONDS, get_recommendations), sp, tracks, artists, limit=10,
+        max_workers=CANDIDATE_WORKERS, cache=ARTIST_CACHE, store=FEATURE_STORE, catalog=CATALOG,
+        pools=CANDIDATE_POOLS, user_id=user_id, pool_view=f"{time_range}:{limit}", limiter=RATE_LIMITER
+    )
 
 
 def create_spotify_oauth(force_reauth=False):
+    # Tokens are kept in TOKEN_STORE, so spotipy's own cache is throwaway
+    # (no .cache-<uuid> files).
     return SpotifyOAuth(
         client_id=CLIENT_ID,
         client_secret=CLIENT_SECRET,
         redirect_uri=REDIRECT_URI,
         scope=SCOPE,
-        cache_path=f".cache-{session.get('uuid','')}",
+        cache_handler=MemoryCacheHandler(),
         show_dialog=force_reauth
     )
 
 
+def current_token():
+    """This session's token_info, refreshed first if it is about to expire."""
+    return TOKEN_STORE.get_fresh(session.get("uuid"), create_spotify_oauth)
+
+
+@app.before_request
+def start_request_trace():
+    g.trace = metrics.start_trace(f"{request.method} {request.path}")
+
+
+@app.after_request
+def record_request_metrics(response):
+    trace = g.get("trace")
+    if trace is not None:
+        metrics.REQUEST_SECONDS.observe(
+            trace.elapsed(), request.url_rule.rule if request.url_rule else "unmatched", response.status_code
+        )
+        metrics.log_if_slow(trace, SLOW_REQUEST_SECONDS)
+    return response
+
+
 @app.route("/")
 def home():
     return render_template("login.html")
@@ -37,9 +181,6 @@ def home():
 @app.route("/login")
 def login():
     session["uuid"] = str(uuid.uuid4())
-    cache_path = f".cache-{session['uuid']}"
-    if os.path.exists(cache_path):
-        os.remove(cache_path)
 
     sp_oauth = create_spotify_oauth(force_reauth=True)
     auth_url = sp_oauth.get_authorize_url()
@@ -47,27 +188,32 @@ def login():
 
 @app.route("/callback")
 def callback():
+    session_id = session.get("uuid")
+    if not session_id:
+        return redirect(url_for("login"))
+
     sp_oauth = create_spotify_oauth()
     code = request.args.get("code")
-    token_info = sp_oauth.get_access_token(code)
-    session["token_info"] = token_info
+    token_info = sp_oauth.get_access_token(code, check_cache=False)
+    TOKEN_STORE.set(session_id, token_info)
+    TOKEN_STORE.purge_expired()
     return redirect(url_for("dashboard"))
 
 @app.route("/logout")
 def logout():
-    cache_path = f".cache-{session.get('uuid')}"
-    if cache_path and os.path.exists(cache_path):
-        os.remove(cache_path)
+    TOKEN_STORE.delete(session.get("uuid"))
+    if SESSION_MEMO:
+        SESSION_MEMO.clear(session.get("uuid", ""))
     session.clear()
     return redirect(url_for("home"))
 
 @app.route("/dashboard")
 def dashboard():
-    token_info = session.get("token_info", None)
+    token_info = current_token()
     if not token_info:
         return redirect(url_for("login"))
 
-    sp = spotipy.Spotify(auth=token_info["access_token"])
+    sp = get_spotify(token_info)
 
   
     user_profile = sp.current_user()
@@ -81,7 +227,8 @@ def dashboard():
     artists = sp.current_user_top_artists(limit=limit, time_range=time_range)["items"]
 
    
-    recs = get_recommendations(sp, tracks, artists, limit=10)
+    job = start_recommendation_job(sp, time_range, limit, tracks=tracks, artists=artists)
+    recs = job.result if job.status == DONE else None
 
     return render_template(
         "dashboard.html",
@@ -95,18 +242,44 @@ def dashboard():
 
 @app.route("/recommendations")
 def recommendations():
-    token_info = session.get("token_info", None)
+    token_info = current_token()
     if not token_info:
         return redirect(url_for("login"))
 
-    sp = spotipy.Spotify(auth=token_info["access_token"])
+    sp = get_spotify(token_info)
 
     top_tracks = sp.current_user_top_tracks(limit=50, time_range="medium_term")["items"]
     top_artists = sp.current_user_top_artists(limit=50, time_range="medium_term")["items"]
 
-    recs = get_recommendations(sp, top_tracks, top_artists, limit=50)
+    recs = get_recommendations(sp, top_tracks, top_artists, limit=50, max_workers=CANDIDATE_WORKERS,
+                               cache=ARTIST_CACHE, store=FEATURE_STORE,
+                               catalog=CATALOG, pools=CANDIDATE_POOLS,
+                               user_id=sp.current_user()["id"], pool_view="medium_term:50",
+                               limiter=RATE_LIMITER)
 
     return render_template("recommendations.html", recs=recs)
 
+@app.route("/api/recommendations")
+def recommendations_status():
+    token_info = current_token()
+    if not token_info:
+        return jsonify({"status": "error", "error": "not logged in"}), 401
+
+    time_range = request.args.get("time_range", "short_term")
+    limit = int(request.args.get("limit", 10))
+
+    job = REC_JOBS.get(rec_job_key(time_range, limit))
+    if job is None:
+        job = start_recommendation_job(get_spotify(token_info), time_range, limit)
+    return jsonify(job.to_dict())
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/cache-stats")
+def cache_stats():
+    return jsonify(ARTIST_CACHE.stats())
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_store import LocalConnection
+
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+PURGE_EVERY = 500
+
+
+class ArtistCache:
+    """
+    Two-tier cache for user-agnostic artist data (top tracks, related artists).
+
+    - A bounded in-process LRU with per-entry TTL answers most lookups.
+    - An optional SQLite file (WAL mode) sits behind it, so every gunicorn
+      worker shares the same entries and they survive restarts.
+
+    Keys are tuples like ("top_tracks", artist_id, country). Values must be
+    JSON-serialisable (raw Spotify responses are).
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = LocalConnection(path)
+        self._writes = 0
+        self._stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+        if path:
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS artist_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.purge_expired()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if absent or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._lru.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._lru[key]
+                self._stats["expired"] += 1
+
+        if self.path:
+            row = self._db().execute(
+                "SELECT value, expires_at FROM artist_cache WHERE key = ?",
+                (_db_key(key),)
+            ).fetchone()
+            if row and row[1] > now:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self._count("disk_hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self.path:
+            self._db().execute(
+                "INSERT OR REPLACE INTO artist_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (_db_key(key), json.dumps(value), expires_at)
+            )
+            with self._lock:
+                self._writes += 1
+                purge = self._writes % PURGE_EVERY == 0
+            if purge:
+                self.purge_expired()
+
+    def get_or_fetch(self, key, loader):
+        """Return the cached value for `key`, calling `loader()` to fill a miss."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._lru[key] = (expires_at, value)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def purge_expired(self):
+        """Drop expired rows from the persistent tier."""
+        if not self.path:
+            return 0
+        removed = self._db().execute(
+            "DELETE FROM artist_cache WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+        self._count("expired", max(removed, 0))
+        return removed
+
+    def stats(self):
+        """Counters plus current sizes, for sizing the cache."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._lru)
+        stats["max_entries"] = self.max_entries
+        if self.path:
+            stats["disk_entries"] = self._db().execute(
+                "SELECT COUNT(*) FROM artist_cache"
+            ).fetchone()[0]
+        return stats
+
+
+def _db_key(key):
+    return "|".join(str(part) for part in key)
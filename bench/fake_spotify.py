@@ -0,0 +1,231 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from spotipy.exceptions import SpotifyException
+
+
+class FakeCatalog:
+    """
+    Users, artists, tracks and the related-artist graph served by FakeSpotify.
+
+    Build a synthetic one with `FakeCatalog.synthetic(...)`, or load recorded
+    fixtures with `FakeCatalog.load(path)`. The JSON layout is:
+
+        {"artists": {artist_id: {"name", "related": [ids], "tracks": [track objects]}},
+         "users": {user_id: {"top_artists": [ids], "top_tracks": [ids], "recent": [ids]}}}
+
+    Track objects use the Spotify shape (id, name, artists, album.images,
+    preview_url) and may carry an "audio_features" dict.
+    """
+
+    def __init__(self, artists, users):
+        self.artists = artists
+        self.users = users
+        self.tracks = {
+            track["id"]: track
+            for artist in artists.values()
+            for track in artist["tracks"]
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["artists"], data["users"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"artists": self.artists, "users": self.users}, f)
+
+    @classmethod
+    def synthetic(cls, n_users=50, n_artists=2000, tracks_per_artist=10, related_per_artist=20,
+                  top_per_user=50, seed=0):
+        """
+        Random catalog where artist popularity is Zipf-like, so users overlap
+        heavily on popular artists the way real listeners do.
+        """
+        rng = random.Random(seed)
+        artists = {}
+        for a in range(n_artists):
+            artist_id = f"artist{a}"
+            artists[artist_id] = {
+                "name": f"Artist {a}",
+                "related": [],
+                "tracks": [
+                    {
+                        "id": f"{artist_id}-t{t}",
+                        "name": f"Song {t} by Artist {a}",
+                        "artists": [{"id": artist_id, "name": f"Artist {a}"}],
+                        "album": {"images": [{"url": f"https://img.example/{artist_id}/{t}"}] * 3},
+                        "preview_url": None,
+                        "audio_features": {
+                            "danceability": rng.random(),
+                            "energy": rng.random(),
+                            "valence": rng.random(),
+                            "acousticness": rng.random(),
+                            "instrumentalness": rng.random(),
+                            "liveness": rng.random(),
+                            "speechiness": rng.random(),
+                            "tempo": rng.uniform(60, 200),
+                            "loudness": rng.uniform(-30, 0),
+                            "key": rng.randrange(12),
+                            "mode": rng.randrange(2),
+                        },
+                    }
+                    for t in range(tracks_per_artist)
+                ],
+            }
+
+        ids = list(artists)
+        weights = [1.0 / (rank + 1) for rank in range(n_artists)]
+        for artist_id in ids:
+            related = set()
+            while len(related) < min(related_per_artist, n_artists - 1):
+                other = rng.choices(ids, weights)[0]
+                if other != artist_id:
+                    related.add(other)
+            artists[artist_id]["related"] = sorted(related)
+
+        users = {}
+        for u in range(n_users):
+            top_artists = []
+            while len(top_artists) < min(top_per_user, n_artists):
+                pick = rng.choices(ids, weights)[0]
+                if pick not in top_artists:
+                    top_artists.append(pick)
+            tracks = [artists[a]["tracks"][rng.randrange(tracks_per_artist)]["id"] for a in top_artists]
+            users[f"user{u}"] = {
+                "top_artists": top_artists,
+                "top_tracks": tracks,
+                "recent": tracks[: top_per_user // 2],
+            }
+        return cls(artists, users)
+
+
+class FakeBackend:
+    """
+    Shared state for all FakeSpotify clients: the catalog, latency/429
+    injection settings and per-endpoint call counters.
+
+    - latency: seconds added to every call, plus uniform(0, jitter)
+    - rate_429: probability that a call fails with a 429 carrying Retry-After
+    """
+
+    def __init__(self, catalog, latency=0.0, jitter=0.0, rate_429=0.0, retry_after=1, seed=0):
+        self.catalog = catalog
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.throttled = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def client(self, access_token):
+        """spotipy-compatible client for the user named by `access_token`."""
+        return FakeSpotify(self, access_token)
+
+    def hit(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter) if self.jitter else self.latency
+            throttle = self.rate_429 and self._rng.random() < self.rate_429
+            if throttle:
+                self.throttled[endpoint] += 1
+        if delay:
+            time.sleep(delay)
+        if throttle:
+            raise SpotifyException(
+                429, -1, f"{endpoint}: API rate limit exceeded",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.throttled.clear()
+
+
+class FakeSpotify:
+    """The subset of spotipy.Spotify that EchoDash uses, served from a FakeCatalog."""
+
+    def __init__(self, backend, user_id):
+        self.backend = backend
+        self.catalog = backend.catalog
+        self.user_id = user_id
+
+    def _user(self):
+        user = self.catalog.users.get(self.user_id)
+        if user is None:
+            raise SpotifyException(401, -1, "The access token expired")
+        return user
+
+    def _artist_obj(self, artist_id):
+        artist = self.catalog.artists[artist_id]
+        return {
+            "id": artist_id,
+            "name": artist["name"],
+            "genres": [],
+            "images": [{"url": f"https://img.example/{artist_id}"}] * 3,
+        }
+
+    def _track_obj(self, track_id):
+        track = self.catalog.tracks[track_id]
+        return {k: v for k, v in track.items() if k != "audio_features"}
+
+    def _artist(self, artist_id):
+        artist = self.catalog.artists.get(artist_id)
+        if artist is None:
+            raise SpotifyException(404, -1, "non existing id")
+        return artist
+
+    def current_user(self):
+        self.backend.hit("me")
+        self._user()
+        return {"id": self.user_id, "display_name": self.user_id, "images": []}
+
+    def current_user_top_tracks(self, limit=20, offset=0, time_range="medium_term"):
+        self.backend.hit("me/top/tracks")
+        ids = self._user()["top_tracks"][offset:offset + limit]
+        return {"items": [self._track_obj(t) for t in ids], "limit": limit, "offset": offset}
+
+    def current_user_top_artists(self, limit=20, offset=0, time_range="medium_term"):
+        self.backend.hit("me/top/artists")
+        ids = self._user()["top_artists"][offset:offset + limit]
+        return {"items": [self._artist_obj(a) for a in ids], "limit": limit, "offset": offset}
+
+    def current_user_recently_played(self, limit=50, after=None, before=None):
+        self.backend.hit("me/player/recently-played")
+        ids = self._user()["recent"][:limit]
+        return {"items": [{"track": self._track_obj(t)} for t in ids]}
+
+    def artist_top_tracks(self, artist_id, country="US"):
+        self.backend.hit("artists/top-tracks")
+        return {"tracks": [self._track_obj(t["id"]) for t in self._artist(artist_id)["tracks"]]}
+
+    def artist_related_artists(self, artist_id):
+        self.backend.hit("artists/related-artists")
+        return {"artists": [self._artist_obj(a) for a in self._artist(artist_id)["related"]]}
+
+    def track(self, track_id, market=None):
+        self.backend.hit("tracks/{id}")
+        if track_id not in self.catalog.tracks:
+            raise SpotifyException(404, -1, "non existing id")
+        return self._track_obj(track_id)
+
+    def tracks(self, tracks, market=None):
+        self.backend.hit("tracks")
+        return {"tracks": [self._track_obj(t) if t in self.catalog.tracks else None for t in tracks]}
+
+    def audio_features(self, tracks=[]):
+        self.backend.hit("audio-features")
+        features = []
+        for track_id in tracks:
+            track = self.catalog.tracks.get(track_id)
+            features.append(dict(track["audio_features"], id=track_id) if track else None)
+        return features
+
@@ -0,0 +1,219 @@
+"""
+Offline load benchmark: drives the Flask app with simulated users against
+FakeSpotify, so performance changes can be compared without credentials or
+network.
+
+    python -m bench.run --users 20 --concurrency 8 --latency 0.05 --jitter 0.02
+    python -m bench.run ... --json after.json --baseline before.json
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fake_spotify import FakeBackend, FakeCatalog
+
+
+PAGES = ("dashboard", "recommendations")
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def load_app(state_dir):
+    """Import the app with all of its on-disk state pointed at `state_dir`."""
+    os.environ.setdefault("ECHODASH_ARTIST_CACHE_PATH", os.path.join(state_dir, "artist_cache.sqlite3"))
+    os.environ.setdefault("ECHODASH_FEATURE_STORE_PATH", os.path.join(state_dir, "features"))
+    os.environ.setdefault("ECHODASH_CATALOG_PATH", os.path.join(state_dir, "catalog.sqlite3"))
+    os.environ.setdefault("ECHODASH_TOKEN_STORE_PATH", os.path.join(state_dir, "tokens.sqlite3"))
+    os.environ.setdefault("ECHODASH_POOL_PATH", os.path.join(state_dir, "candidate_pools.sqlite3"))
+    import app as echodash
+    return echodash
+
+
+class Recorder:
+    def __init__(self):
+        self.timings = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok=True):
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def simulate_user(echodash, user_id, args, recorder):
+    """One user: log in, then load the dashboard `visits` times."""
+    client = echodash.app.test_client()
+    with client.session_transaction() as sess:
+        sess["uuid"] = user_id
+    echodash.TOKEN_STORE.set(user_id, {
+        "access_token": user_id,
+        "refresh_token": user_id,
+        "expires_at": int(time.time()) + 24 * 60 * 60,
+    })
+
+    query = f"time_range={args.time_range}&limit={args.limit}"
+    for _ in range(args.visits):
+        start = time.perf_counter()
+        resp = client.get(f"/dashboard?{query}")
+        recorder.record("/dashboard", time.perf_counter() - start, resp.status_code == 200)
+
+        # Wait for the background recommendations, as the page's JS would.
+        deadline = start + args.timeout
+        while time.perf_counter() < deadline:
+            resp = client.get(f"/api/recommendations?{query}")
+            status = resp.get_json().get("status") if resp.status_code == 200 else "error"
+            if status != "pending":
+                break
+            time.sleep(args.poll_interval)
+        else:
+            status = "timeout"
+        recorder.record("dashboard+recommendations", time.perf_counter() - start, status == "done")
+
+        if "recommendations" in args.pages:
+            start = time.perf_counter()
+            resp = client.get("/recommendations")
+            recorder.record("/recommendations", time.perf_counter() - start, resp.status_code == 200)
+
+
+def run(args):
+    if args.fixtures:
+        catalog = FakeCatalog.load(args.fixtures)
+    else:
+        catalog = FakeCatalog.synthetic(n_users=args.users, n_artists=args.artists, seed=args.seed)
+    backend = FakeBackend(
+        catalog, latency=args.latency, jitter=args.jitter,
+        rate_429=args.rate_429, retry_after=args.retry_after, seed=args.seed
+    )
+
+    state_dir = tempfile.mkdtemp(prefix="echodash-bench-")
+    echodash = load_app(state_dir)
+    echodash.app.config["SPOTIFY_CLIENT_FACTORY"] = backend.client
+
+    users = sorted(catalog.users)[:args.users]
+    recorder = Recorder()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(simulate_user, echodash, u, args, recorder) for u in users]:
+            future.result()
+    wall = time.perf_counter() - start
+
+    visits = len(users) * args.visits
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+        "wall_seconds": wall,
+        "latency": {name: summarize(values) for name, values in recorder.timings.items()},
+        "errors": recorder.errors,
+        "spotify_calls": dict(backend.calls),
+        "spotify_calls_total": sum(backend.calls.values()),
+        "spotify_calls_per_visit": sum(backend.calls.values()) / max(visits, 1),
+        "throttled": dict(backend.throttled),
+        # ru_maxrss is KiB on Linux.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        "state_dir": state_dir,
+    }
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+
+def _delta(new, old):
+    if not old or new is None:
+        return ""
+    return f" ({(new - old) / old:+.0%})"
+
+
+def report(result, baseline=None):
+    baseline = baseline or {}
+    base_latency = baseline.get("latency", {})
+    print(f"wall time: {result['wall_seconds']:.2f}s")
+    print("latency:")
+    for name, stats in sorted(result["latency"].items()):
+        old = base_latency.get(name, {})
+        cols = "  ".join(f"{p}={_fmt(stats[p])}{_delta(stats[p], old.get(p))}" for p in ("p50", "p95", "p99"))
+        errors = result["errors"].get(name, 0)
+        print(f"  {name:<28} n={stats['count']:<5} {cols}" + (f"  errors={errors}" if errors else ""))
+    print("spotify calls:")
+    base_calls = baseline.get("spotify_calls", {})
+    for endpoint, count in sorted(result["spotify_calls"].items()):
+        throttled = result["throttled"].get(endpoint, 0)
+        print(f"  {endpoint:<28} {count}{_delta(count, base_calls.get(endpoint))}"
+              + (f"  (429: {throttled})" if throttled else ""))
+    print(f"  {'total':<28} {result['spotify_calls_total']}"
+          f"{_delta(result['spotify_calls_total'], baseline.get('spotify_calls_total'))}"
+          f"  ({result['spotify_calls_per_visit']:.1f} per visit)")
+    print(f"peak RSS: {result['peak_rss_mb']:.1f}MB{_delta(result['peak_rss_mb'], baseline.get('peak_rss_mb'))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--visits", type=int, default=2, help="dashboard loads per user")
+    parser.add_argument("--artists", type=int, default=2000, help="synthetic catalog size")
+    parser.add_argument("--fixtures", help="recorded FakeCatalog JSON instead of a synthetic one")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per Spotify call")
+    parser.add_argument("--jitter", type=float, default=0.01, help="extra uniform(0, jitter) seconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="probability a call gets a 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--time-range", default="medium_term")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--pages", default="dashboard", help="comma list: dashboard,recommendations")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    args = parser.parse_args(argv)
+    args.pages = args.pages.split(",")
+    unknown = [p for p in args.pages if p not in PAGES]
+    if unknown:
+        parser.error(f"unknown page(s): {', '.join(unknown)}")
+    # /recommendations renders templates/recommendations.html, which the app
+    # doesn't ship yet; timing it would only measure the TemplateNotFound path.
+    if "recommendations" in args.pages and not os.path.exists(os.path.join(TEMPLATES_DIR, "recommendations.html")):
+        parser.error("--pages recommendations: templates/recommendations.html is missing, "
+                     "so /recommendations can only return an error")
+
+    result = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(result, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import json
+import time
+
+from sqlite_store import LocalConnection
+
+
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+
+class CandidatePoolStore:
+    """
+    Persisted candidate pools, so repeat visits only expand the artists that
+    are new in the user's top list.
+
+    Pools are keyed by user and `view`: the top list they were built from
+    (e.g. "short_term:10"). Different views have different artists and taste
+    vectors, so sharing one pool would make each view throw away the other's.
+
+    A pool holds:
+    - artists: {artist_id: [candidate rows]} as built by expand_artists
+    - centroid: the taste vector the scores were computed against
+    - scores: {track_id: score}
+    - built_at: when the pool was last built from scratch
+
+    Pools older than `max_age` seconds are treated as missing, which forces
+    a full rebuild. Stored in SQLite (WAL) so all workers share them.
+    """
+
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._db = LocalConnection(path)
+        # Pools are only a cache: a table from before pools were keyed by view
+        # is dropped and rebuilt rather than migrated.
+        columns = {row[1] for row in self._db().execute("PRAGMA table_info(candidate_pools)")}
+        if columns and "view" not in columns:
+            self._db().execute("DROP TABLE candidate_pools")
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS candidate_pools ("
+            " user_id TEXT NOT NULL, view TEXT NOT NULL, built_at REAL NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (user_id, view))"
+        )
+
+    def load(self, user_id, view=""):
+        """The user's pool for `view` as a dict, or None if there is none or it is too old."""
+        row = self._db().execute(
+            "SELECT built_at, data FROM candidate_pools WHERE user_id = ? AND view = ? AND built_at > ?",
+            (user_id, view, time.time() - self.max_age)
+        ).fetchone()
+        if row is None:
+            return None
+        pool = json.loads(row[1])
+        pool["built_at"] = row[0]
+        return pool
+
+    def save(self, user_id, artists, centroid, scores, built_at=None, view=""):
+        data = {
+            "artists": artists,
+            "centroid": None if centroid is None else [float(x) for x in centroid],
+            "scores": {track_id: float(score) for track_id, score in scores.items()},
+        }
+        self._db().execute(
+            "INSERT OR REPLACE INTO candidate_pools (user_id, view, built_at, data) VALUES (?, ?, ?, ?)",
+            (user_id, view, built_at or time.time(), json.dumps(data))
+        )
+
+    def delete(self, user_id, view=None):
+        """Drop the user's pool for `view`, or all of their pools when view is None."""
+        if view is None:
+            self._db().execute("DELETE FROM candidate_pools WHERE user_id = ?", (user_id,))
+        else:
+            self._db().execute("DELETE FROM candidate_pools WHERE user_id = ? AND view = ?", (user_id, view))
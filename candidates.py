@@ -0,0 +1,117 @@
+import numpy as np
+
+
+# Source labels, stored as small integer codes.
+SOURCES = ("top_artist", "related_artist", "catalog")
+SOURCE_CODES = {name: code for code, name in enumerate(SOURCES)}
+
+
+class Candidates:
+    """
+    Columnar candidate set: one entry per track, parallel columns.
+
+    - ids, names, album_images, preview_urls: Python lists
+    - artist_codes: int32 index into `artist_names` (each name stored once)
+    - source_codes: int8 index into SOURCES
+    - hydrated: bool, True once album art / preview are known
+    - scores: float32
+
+    Built with `from_rows`, which keeps the first occurrence of each track ID.
+    """
+
+    __slots__ = (
+        "ids", "names", "album_images", "preview_urls", "artist_names",
+        "artist_codes", "source_codes", "hydrated", "scores",
+    )
+
+    def __init__(self, ids, names, album_images, preview_urls, artist_names,
+                 artist_codes, source_codes, hydrated, scores=None):
+        self.ids = ids
+        self.names = names
+        self.album_images = album_images
+        self.preview_urls = preview_urls
+        self.artist_names = artist_names
+        self.artist_codes = artist_codes
+        self.source_codes = source_codes
+        self.hydrated = hydrated
+        self.scores = scores if scores is not None else np.zeros(len(ids), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def empty(cls):
+        return cls.from_rows([])
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build from an iterable of candidate dicts ("id", "name", "artist",
+        "source" and optionally "album_image", "preview_url", "hydrated",
+        "similarity"). Later duplicates of an ID are dropped.
+        """
+        seen = set()
+        ids, names, images, previews, hydrated, scores = [], [], [], [], [], []
+        artist_index, artist_codes, source_codes = {}, [], []
+        for row in rows:
+            if row["id"] in seen:
+                continue
+            seen.add(row["id"])
+            ids.append(row["id"])
+            names.append(row["name"])
+            images.append(row.get("album_image"))
+            previews.append(row.get("preview_url"))
+            hydrated.append(bool(row.get("hydrated")))
+            scores.append(row.get("similarity", 0.0))
+            artist_codes.append(artist_index.setdefault(row["artist"], len(artist_index)))
+            source_codes.append(SOURCE_CODES[row["source"]])
+        return cls(
+            ids, names, images, previews, list(artist_index),
+            np.array(artist_codes, dtype=np.int32),
+            np.array(source_codes, dtype=np.int8),
+            np.array(hydrated, dtype=bool),
+            np.array(scores, dtype=np.float32),
+        )
+
+    def concat(self, other):
+        """This set followed by the entries of `other` whose IDs aren't here yet."""
+        return Candidates.from_rows(list(self.rows()) + list(other.rows()))
+
+    def take(self, idx):
+        """Subset (in the given order) by an index array or boolean mask."""
+        idx = np.asarray(idx)
+        idx = np.flatnonzero(idx) if idx.dtype == bool else idx.astype(np.int64)
+        return Candidates(
+            [self.ids[i] for i in idx],
+            [self.names[i] for i in idx],
+            [self.album_images[i] for i in idx],
+            [self.preview_urls[i] for i in idx],
+            self.artist_names,
+            self.artist_codes[idx],
+            self.source_codes[idx],
+            self.hydrated[idx],
+            self.scores[idx],
+        )
+
+    def exclude(self, track_ids):
+        """Drop entries whose ID is in `track_ids`."""
+        track_ids = set(track_ids)
+        keep = np.fromiter((t not in track_ids for t in self.ids), dtype=bool, count=len(self.ids))
+        return self if keep.all() else self.take(keep)
+
+    def artist(self, i):
+        return self.artist_names[self.artist_codes[i]]
+
+    def rows(self):
+        """Entries as candidate dicts (the inverse of from_rows)."""
+        for i, track_id in enumerate(self.ids):
+            yield {
+                "id": track_id,
+                "name": self.names[i],
+                "artist": self.artist(i),
+                "source": SOURCES[self.source_codes[i]],
+                "album_image": self.album_images[i],
+                "preview_url": self.preview_urls[i],
+                "hydrated": bool(self.hydrated[i]),
+                "similarity": float(self.scores[i]),
+            }
@@ -0,0 +1,177 @@
+import threading
+
+import numpy as np
+
+from feature_store import FEATURE_DIM
+from sqlite_store import LocalConnection
+
+
+DEFAULT_TABLES = 8
+DEFAULT_BITS = 10
+
+
+class CatalogIndex:
+    """
+    Approximate nearest-neighbour index over every track we've ever scored.
+
+    Track metadata lives in a SQLite file (WAL, shared by workers); vectors
+    come from the FeatureStore. Search is random-projection LSH: each of
+    `n_tables` tables hashes a vector to `n_bits` hyperplane signs, and a
+    query scores only tracks sharing a bucket (or, with multi-probe, a bucket
+    one bit away) in at least one table. Hyperplanes are derived from `seed`,
+    so every process builds identical tables from the same rows.
+
+    Buckets are kept in memory and synced incrementally from the SQLite file,
+    so tracks added by other workers show up on the next query.
+    """
+
+    def __init__(self, path, store, n_tables=DEFAULT_TABLES, n_bits=DEFAULT_BITS, seed=0):
+        self.path = path
+        self.store = store
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((FEATURE_DIM, n_tables * n_bits)).astype(np.float32)
+        self._weights = (1 << np.arange(n_bits)).astype(np.int64)
+        self._lock = threading.Lock()
+        self._db = LocalConnection(path)
+
+        self._last_row = 0
+        # Rows whose features weren't in the store yet, and the store size
+        # when they were last checked.
+        self._pending = []
+        self._pending_checked = 0
+        self._ids = []
+        self._meta = []
+        self._vectors = np.zeros((0, FEATURE_DIM), dtype=np.float32)
+        self._buckets = [dict() for _ in range(n_tables)]
+
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS catalog ("
+            " row INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL,"
+            " name TEXT, artist TEXT, album_image TEXT, preview_url TEXT)"
+        )
+
+    def __len__(self):
+        self.sync()
+        return len(self._ids)
+
+    def _codes(self, vecs):
+        """(n, n_tables) bucket codes for a batch of vectors."""
+        bits = (vecs @ self._planes > 0).reshape(len(vecs), self.n_tables, self.n_bits)
+        return bits.astype(np.int64) @ self._weights
+
+    def sync(self):
+        """
+        Load catalog rows added (by any process) since the last sync. Rows
+        whose features aren't stored yet stay pending and are re-checked
+        once the FeatureStore has grown.
+        """
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT row, id, name, artist, album_image, preview_url"
+                " FROM catalog WHERE row > ? ORDER BY row",
+                (self._last_row,)
+            ).fetchall()
+            if rows:
+                self._last_row = rows[-1][0]
+            if self._pending and len(self.store) != self._pending_checked:
+                rows = self._pending + rows
+                self._pending = []
+            if not rows:
+                return
+
+            vecs, found = self.store.vectors([r[1] for r in rows])
+            self._pending.extend(r for r, f in zip(rows, found) if not f)
+            self._pending_checked = len(self.store)
+            keep = found & (np.abs(vecs).sum(axis=1) > 0)
+            if not keep.any():
+                return
+            rows = [r for r, k in zip(rows, keep) if k]
+            vecs = vecs[keep]
+
+            start = len(self._ids)
+            self._ids.extend(r[1] for r in rows)
+            self._meta.extend(rows)
+            self._vectors = np.concatenate([self._vectors, vecs])
+            for offset, codes in enumerate(self._codes(vecs)):
+                for table, code in enumerate(codes):
+                    self._buckets[table].setdefault(int(code), []).append(start + offset)
+
+    def add(self, tracks):
+        """
+        Add tracks to the catalog. `tracks` are dicts with at least "id",
+        plus "name", "artist", "album_image" and "preview_url" when known.
+        Tracks already present are ignored. Tracks without features in the
+        FeatureStore aren't searchable until their features are stored.
+        """
+        self._db().executemany(
+            "INSERT OR IGNORE INTO catalog (id, name, artist, album_image, preview_url)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [
+                (t["id"], t.get("name"), t.get("artist"), t.get("album_image"), t.get("preview_url"))
+                for t in tracks
+            ]
+        )
+
+    def _probe(self, query, multiprobe):
+        """Positions sharing a bucket with `query` in any table."""
+        hits = []
+        for table, code in enumerate(self._codes(query[None, :])[0]):
+            codes = [int(code)]
+            if multiprobe:
+                codes.extend(int(code) ^ (1 << b) for b in range(self.n_bits))
+            buckets = self._buckets[table]
+            for c in codes:
+                if c in buckets:
+                    hits.append(buckets[c])
+        if not hits:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(hits))
+
+    def search(self, query, k=50, exclude=(), multiprobe=True):
+        """
+        Approximate top-k catalog tracks by cosine similarity to `query`
+        (e.g. the user's taste centroid). Returns candidate dicts, best first,
+        with a "similarity" key. Tracks in `exclude` are skipped.
+        """
+        self.sync()
+        positions = self._probe(np.asarray(query, dtype=np.float32), multiprobe)
+        if exclude and len(positions):
+            exclude = set(exclude)
+            positions = np.array([p for p in positions if self._ids[p] not in exclude], dtype=np.int64)
+        if not len(positions):
+            return []
+
+        scores = self._vectors[positions] @ query
+        order = np.argsort(-scores, kind="stable")[:k]
+        results = []
+        for i in order:
+            _, track_id, name, artist, album_image, preview_url = self._meta[positions[i]]
+            results.append({
+                "id": track_id,
+                "name": name,
+                "artist": artist,
+                "source": "catalog",
+                "album_image": album_image,
+                "preview_url": preview_url,
+                "hydrated": album_image is not None,
+                "similarity": float(scores[i]),
+            })
+        return results
+
+    def recall(self, queries, k=50, multiprobe=True):
+        """
+        Mean recall@k of `search` against brute-force cosine over the whole
+        catalog, for a (n, FEATURE_DIM) batch of query vectors.
+        """
+        self.sync()
+        if not len(self._ids):
+            return 0.0
+        total = 0.0
+        for query in np.asarray(queries, dtype=np.float32):
+            exact = np.argsort(-(self._vectors @ query), kind="stable")[:k]
+            truth = {self._ids[p] for p in exact}
+            found = {t["id"] for t in self.search(query, k=k, multiprobe=multiprobe)}
+            total += len(truth & found) / len(truth)
+        return total / len(queries)
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def mmr_rerank(vectors, scores, k, lam=0.7, artist_codes=None, per_artist=None):
+    """
+    Pick `k` items by maximal marginal relevance: each step takes the item
+    maximising
+
+        lam * score - (1 - lam) * (max cosine similarity to anything picked)
+
+    `vectors` are unit-length rows (zero rows count as similar to nothing).
+    With `artist_codes` and `per_artist`, an artist drops out once it has
+    `per_artist` picks.
+
+    Each pick updates a running max-similarity array with one matrix-vector
+    product, so the whole pass is O(k * n * d), not O(k * n^2).
+    Returns the picked indices in order.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    max_sim = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    relevance = lam * scores
+    counts = {}
+    picked = []
+
+    for _ in range(k):
+        objective = np.where(available, relevance - (1 - lam) * max_sim, -np.inf)
+        best = int(np.argmax(objective))
+        if not available[best]:
+            break
+        picked.append(best)
+        available[best] = False
+        np.maximum(max_sim, vectors @ vectors[best], out=max_sim)
+
+        if per_artist is not None and artist_codes is not None:
+            code = artist_codes[best]
+            counts[code] = counts.get(code, 0) + 1
+            if counts[code] >= per_artist:
+                available &= artist_codes != code
+
+    return np.array(picked, dtype=np.int64)
@@ -0,0 +1,187 @@
+import csv
+import fcntl
+import os
+import threading
+
+import numpy as np
+
+from metrics import SKIPPED
+
+
+AUDIO_FEATURES_BATCH_SIZE = 100
+INITIAL_CAPACITY = 1024
+
+# (name, low, high): each audio feature is scaled to [0, 1] using its range.
+FEATURES = [
+    ("danceability", 0.0, 1.0),
+    ("energy", 0.0, 1.0),
+    ("valence", 0.0, 1.0),
+    ("acousticness", 0.0, 1.0),
+    ("instrumentalness", 0.0, 1.0),
+    ("liveness", 0.0, 1.0),
+    ("speechiness", 0.0, 1.0),
+    ("tempo", 0.0, 250.0),
+    ("loudness", -60.0, 0.0),
+    ("key", 0.0, 11.0),
+    ("mode", 0.0, 1.0),
+]
+FEATURE_DIM = len(FEATURES)
+
+
+def feature_vector(features):
+    """
+    Turn one audio-features object into a unit-length float32 vector.
+
+    Features are scaled to [0, 1] and centred on 0.5 before normalising;
+    otherwise every vector points into the same corner and all cosines are ~1.
+    Missing features (None) give the zero vector, which scores 0 against anything.
+    """
+    vec = np.zeros(FEATURE_DIM, dtype=np.float32)
+    if not features:
+        return vec
+    for i, (name, low, high) in enumerate(FEATURES):
+        value = features.get(name)
+        if value is None:
+            continue
+        vec[i] = min(max((float(value) - low) / (high - low), 0.0), 1.0) - 0.5
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+class FeatureStore:
+    """
+    Audio-feature vectors for every track we've seen, one row per track ID.
+
+    Layout on disk (in `path`):
+    - vectors.f32: float32 rows of FEATURE_DIM, opened as a memmap so all
+      worker processes share the same pages instead of each loading a copy.
+    - ids.txt: one track ID per line; line number == row number.
+
+    Rows are written (and flushed) before their ID is appended, so a reader
+    never sees an ID without its vector. Writers serialise on a lock file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._ids_path = os.path.join(path, "ids.txt")
+        self._lock_path = os.path.join(path, ".lock")
+        self._lock = threading.Lock()
+        self._index = {}
+        self._ids_offset = 0
+        self._vectors = None
+
+        if not os.path.exists(self._vectors_path):
+            with open(self._vectors_path, "wb") as f:
+                f.truncate(INITIAL_CAPACITY * FEATURE_DIM * 4)
+        open(self._ids_path, "a").close()
+        self._refresh()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, track_id):
+        return track_id in self._index
+
+    def _capacity(self):
+        return os.path.getsize(self._vectors_path) // (FEATURE_DIM * 4)
+
+    def _open_vectors(self):
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+",
+            shape=(self._capacity(), FEATURE_DIM)
+        )
+
+    def _refresh(self):
+        """Pick up rows other processes have added since we last looked."""
+        with self._lock:
+            if os.path.getsize(self._ids_path) != self._ids_offset:
+                with open(self._ids_path, "r") as f:
+                    f.seek(self._ids_offset)
+                    for line in f:
+                        if not line.endswith("\n"):
+                            break
+                        self._index.setdefault(line[:-1], len(self._index))
+                        self._ids_offset += len(line.encode())
+            if self._vectors is None or len(self._vectors) < len(self._index):
+                self._open_vectors()
+
+    def rows(self, track_ids):
+        """Row numbers for `track_ids` (-1 where the track isn't stored)."""
+        self._refresh()
+        return np.array([self._index.get(t, -1) for t in track_ids], dtype=np.int64)
+
+    def vectors(self, track_ids):
+        """
+        (vectors, found): a (len(track_ids), FEATURE_DIM) matrix of unit vectors
+        and a boolean mask. Unknown tracks get zero rows.
+        """
+        rows = self.rows(track_ids)
+        found = rows >= 0
+        out = np.zeros((len(rows), FEATURE_DIM), dtype=np.float32)
+        if found.any():
+            out[found] = self._vectors[rows[found]]
+        return out, found
+
+    def add(self, vectors_by_id):
+        """Store vectors for tracks not already present. Returns how many were added."""
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                new = [(t, v) for t, v in vectors_by_id.items() if t not in self._index]
+                if not new:
+                    return 0
+
+                start = len(self._index)
+                needed = start + len(new)
+                if needed > self._capacity():
+                    capacity = max(self._capacity() * 2, needed)
+                    with open(self._vectors_path, "r+b") as f:
+                        f.truncate(capacity * FEATURE_DIM * 4)
+                    self._open_vectors()
+
+                self._vectors[start:needed] = np.stack([v for _, v in new])
+                self._vectors.flush()
+                with open(self._ids_path, "a") as f:
+                    f.write("".join(f"{t}\n" for t, _ in new))
+                self._refresh()
+                return len(new)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def ensure(self, sp, track_ids, limiter=None):
+        """
+        Fetch audio features for any of `track_ids` we don't have yet, 100 per call.
+        Tracks Spotify has no features for are stored as zero vectors so we
+        don't ask again.
+        """
+        rows = self.rows(track_ids)
+        missing = list(dict.fromkeys(t for t, r in zip(track_ids, rows) if r < 0 and t))
+        fetched = {}
+        for i in range(0, len(missing), AUDIO_FEATURES_BATCH_SIZE):
+            batch = missing[i:i + AUDIO_FEATURES_BATCH_SIZE]
+            try:
+                if limiter is not None:
+                    features = limiter.call(sp.audio_features, batch)
+                else:
+                    features = sp.audio_features(batch)
+            except Exception:
+                SKIPPED.inc("audio_features")
+                continue
+            for track_id, feats in zip(batch, features or []):
+                fetched[track_id] = feature_vector(feats)
+        return self.add(fetched) if fetched else 0
+
+    def load_file(self, filename):
+        """
+        Import features from a CSV with an `id` column plus the audio-feature
+        columns (as exported from the audio-features endpoint), for offline use.
+        """
+        vectors = {}
+        with open(filename, newline="") as f:
+            for row in csv.DictReader(f):
+                feats = {name: float(row[name]) for name, _, _ in FEATURES if row.get(name) not in (None, "")}
+                vectors[row["id"]] = feature_vector(feats)
+        return self.add(vectors)
@@ -0,0 +1,184 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+
+DEFAULT_POOL_SIZE = 32
+DEFAULT_CACHE_ENTRIES = 10000
+
+# Catalog endpoints whose responses don't depend on who is asking, so one
+# cached copy can serve every user. /me/... is never cached. spotipy sends
+# the batch calls as e.g. "tracks/?ids=...", hence the optional slash; the
+# query string stays part of the cache key.
+CACHEABLE_PATHS = re.compile(
+    r"^/v1/(artists/[^/]+(/top-tracks|/related-artists)?|(artists|tracks|audio-features)(/|/[^/]+)?)$"
+)
+
+
+class SharedSession(requests.Session):
+    """
+    A requests.Session that ignores close().
+
+    spotipy.Spotify closes its session in __del__, which would tear down the
+    shared connection pool every time a per-request client is collected.
+    """
+
+    def close(self):
+        pass
+
+    def close_pool(self):
+        super().close()
+
+
+class ConditionalCacheAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a small shared HTTP cache for catalog GETs.
+
+    - Responses still fresh per Cache-Control max-age are served from memory.
+    - Stale ones with an ETag are revalidated with If-None-Match; a 304
+      returns the cached body.
+    - no-store / private responses are never stored; no-cache ones are
+      always revalidated.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"fresh_hits": 0, "revalidated": 0, "misses": 0}
+
+    def send(self, request, **kwargs):
+        if request.method != "GET" or not CACHEABLE_PATHS.match(_path(request.url)):
+            return super().send(request, **kwargs)
+
+        key = request.url
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None and entry["fresh_until"] > time.time():
+            self._count("fresh_hits")
+            return _cached_response(request, entry)
+
+        if entry is not None and entry["etag"]:
+            request.headers["If-None-Match"] = entry["etag"]
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            # Drain the (empty) body so the connection goes back to the pool.
+            response.content
+            entry["fresh_until"] = _fresh_until(response.headers) or entry["fresh_until"]
+            self._count("revalidated")
+            return _cached_response(request, entry)
+
+        self._count("misses")
+        if response.status_code == 200:
+            self._store(key, response)
+        return response
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _store(self, key, response):
+        directives = _cache_control(response.headers)
+        if "no-store" in directives or "private" in directives:
+            return
+        etag = response.headers.get("ETag")
+        fresh_until = 0 if "no-cache" in directives else _fresh_until(response.headers)
+        if not etag and not fresh_until:
+            return
+        entry = {
+            "etag": etag,
+            "fresh_until": fresh_until,
+            "content": response.content,
+            "headers": dict(response.headers),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _path(url):
+    return "/" + url.split("://", 1)[-1].split("/", 1)[-1].split("?", 1)[0]
+
+
+def _cache_control(headers):
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value
+    return directives
+
+
+def _fresh_until(headers):
+    max_age = _cache_control(headers).get("max-age")
+    try:
+        return time.time() + int(max_age) if max_age else 0
+    except ValueError:
+        return 0
+
+
+def _cached_response(request, entry):
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = "OK"
+    response.url = request.url
+    response.request = request
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response._content = entry["content"]
+    response.encoding = "utf-8"
+    return response
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    The process-wide pooled session for Spotify API calls.
+
+    Created lazily per process, so gunicorn's pre-fork workers never share
+    sockets. 5xx and connection errors are retried with backoff; 429s are
+    passed through to the process-wide RateLimiter, which backs off every
+    caller at once. Clients on this session should therefore be wrapped in
+    RateLimitedSpotify (see get_spotify in app.py).
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            pool_size = int(os.getenv("ECHODASH_HTTP_POOL_SIZE", str(DEFAULT_POOL_SIZE)))
+            retry = Retry(
+                total=3,
+                read=False,
+                backoff_factor=0.3,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset(["GET"]),
+                raise_on_status=False,
+            )
+            adapter = ConditionalCacheAdapter(
+                max_entries=int(os.getenv("ECHODASH_HTTP_CACHE_SIZE", str(DEFAULT_CACHE_ENTRIES))),
+                pool_connections=4,
+                pool_maxsize=pool_size,
+                max_retries=retry,
+            )
+            session = SharedSession()
+            session.mount("https://", adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+PENDING = "pending"
+DONE = "done"
+ERROR = "error"
+
+
+class Job:
+    def __init__(self, key):
+        self.key = key
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+    def to_dict(self):
+        data = {"status": self.status}
+        if self.status == DONE:
+            data["result"] = self.result
+        elif self.status == ERROR:
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """
+    Runs slow work (recommendations) on a background worker pool.
+
+    - Jobs are keyed; submitting a key that is already running returns the
+      running job instead of starting another.
+    - Finished results are kept for `result_ttl` seconds, so repeat page views
+      get them immediately. A failed job is replaced on the next submit.
+
+    State is per process: with several gunicorn workers, a poll that lands on
+    another worker simply starts (or finds) the job there.
+    """
+
+    def __init__(self, max_workers=4, result_ttl=300):
+        self.result_ttl = result_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="echodash-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(key)
+            if job is not None and job.status != ERROR:
+                return job
+            job = Job(key)
+            self._jobs[key] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            self._prune()
+            return self._jobs.get(key)
+
+    def _run(self, job, fn, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            job.error = str(e) or e.__class__.__name__
+            job.status = ERROR
+        else:
+            job.result = result
+            job.status = DONE
+        job.finished_at = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            key for key, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for key in expired:
+            del self._jobs[key]
@@ -0,0 +1,216 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from spotipy.exceptions import SpotifyException
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("echodash.slow")
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _labels(self.labels + ("le",), label_values + (repr(float(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _labels(self.labels + ("le",), label_values + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+SPOTIFY_CALL_SECONDS = Histogram(
+    "echodash_spotify_call_seconds", "Spotify API call latency.", ("endpoint", "status")
+)
+STAGE_SECONDS = Histogram(
+    "echodash_stage_seconds", "Time spent in each recommender stage.", ("stage",)
+)
+REQUEST_SECONDS = Histogram(
+    "echodash_request_seconds", "HTTP request latency.", ("endpoint", "status")
+)
+SKIPPED = Counter(
+    "echodash_recommender_skipped_total",
+    "Items the recommender skipped after an error (artists, tracks, batches).", ("stage",)
+)
+
+METRICS = [SPOTIFY_CALL_SECONDS, STAGE_SECONDS, REQUEST_SECONDS, SKIPPED]
+_collectors = []
+
+
+def register_collector(fn):
+    """Add a callable returning extra exposition lines (e.g. cache gauges)."""
+    _collectors.append(fn)
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def gauges(prefix, help_text, values):
+    """Exposition lines for a dict of gauge values (sizes that go up and down)."""
+    lines = []
+    for key, value in sorted(values.items()):
+        name = f"{prefix}_{key}"
+        lines.extend([f"# HELP {name} {help_text} ({key})", f"# TYPE {name} gauge", f"{name} {value}"])
+    return lines
+
+
+def counters(prefix, help_text, values):
+    """Exposition lines for a dict of ever-increasing counts, e.g. cache hits."""
+    lines = []
+    for key, value in sorted(values.items()):
+        name = f"{prefix}_{key}_total"
+        lines.extend([f"# HELP {name} {help_text} ({key})", f"# TYPE {name} counter", f"{name} {value}"])
+    return lines
+
+
+class Trace:
+    """Per-request (or per-job) breakdown of stage timings, for the slow log."""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.stages = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def summary(self):
+        parts = " ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.stages)
+        return f"{self.name} took {self.elapsed() * 1000:.0f}ms: {parts or 'no stages'}"
+
+
+_current_trace = contextvars.ContextVar("echodash_trace", default=None)
+
+
+def start_trace(name):
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def stage(name):
+    """Time a block as recommender stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages.append((name, seconds))
+
+
+def log_if_slow(trace, threshold):
+    """Log the trace's stage breakdown when it took longer than `threshold` seconds."""
+    if threshold and trace.elapsed() > threshold:
+        logger.warning(trace.summary())
+
+
+def traced(name, threshold, fn):
+    """Wrap `fn` so each run gets its own trace and lands in the slow log if slow."""
+    def run(*args, **kwargs):
+        trace = start_trace(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            log_if_slow(trace, threshold)
+    return run
+
+
+class InstrumentedSpotify:
+    """
+    Wraps a spotipy.Spotify (or anything shaped like it) and times every
+    call by method name and outcome: "ok", the HTTP status of a
+    SpotifyException (e.g. "429"), or "error".
+    """
+
+    def __init__(self, sp):
+        self.sp = sp
+
+    def __getattr__(self, name):
+        attr = getattr(self.sp, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                return attr(*args, **kwargs)
+            except SpotifyException as e:
+                status = str(e.http_status)
+                raise
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                SPOTIFY_CALL_SECONDS.observe(time.perf_counter() - start, name, status)
+        return call
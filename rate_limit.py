@@ -0,0 +1,102 @@
+import math
+import threading
+import time
+
+from spotipy.exceptions import SpotifyException
+
+
+DEFAULT_RETRY_AFTER = 1.0
+MAX_RETRIES = 3
+# Longest Retry-After window worth sleeping through; longer ones fail fast.
+MAX_WAIT = 30.0
+
+
+class RateLimiter:
+    """
+    Shared Retry-After backoff for a group of workers.
+    When any call gets a 429, every worker holds off until the window passes,
+    instead of each one hammering the API and collecting its own 429.
+
+    Windows longer than `max_wait` seconds aren't slept through: calls raise
+    a 429 until the window passes, so one long Retry-After can't hang every
+    thread in the process.
+    """
+
+    def __init__(self, max_retries=MAX_RETRIES, max_wait=MAX_WAIT):
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        self._local = threading.local()
+
+    def wait(self):
+        """Sleep out the current backoff window, or raise a 429 if it is longer than max_wait."""
+        with self._lock:
+            delay = self._resume_at - time.monotonic()
+        if delay > self.max_wait:
+            raise SpotifyException(
+                429, -1, f"rate limited for another {delay:.0f}s",
+                headers={"Retry-After": str(math.ceil(delay))}
+            )
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)`, backing off and retrying on 429s.
+        Any other error, a 429 after `max_retries`, or one asking for more
+        than `max_wait` seconds is raised as usual.
+
+        A call made from inside another call() on the same limiter (e.g. a
+        RateLimitedSpotify method called through limiter.call) runs once and
+        leaves the retrying to the outer call.
+        """
+        if getattr(self._local, "active", False):
+            return fn(*args, **kwargs)
+        self._local.active = True
+        try:
+            attempt = 0
+            while True:
+                self.wait()
+                try:
+                    return fn(*args, **kwargs)
+                except SpotifyException as e:
+                    if e.http_status != 429:
+                        raise
+                    self.backoff(retry_after(e))
+                    if attempt >= self.max_retries or retry_after(e) > self.max_wait:
+                        raise
+                    attempt += 1
+        finally:
+            self._local.active = False
+
+
+class RateLimitedSpotify:
+    """
+    Wraps a spotipy.Spotify (or anything shaped like it) so every public
+    method call goes through `limiter`, sharing its Retry-After backoff.
+    """
+
+    def __init__(self, sp, limiter):
+        self.sp = sp
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        attr = getattr(self.sp, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        return lambda *args, **kwargs: self.limiter.call(attr, *args, **kwargs)
+
+
+def retry_after(error):
+    """Seconds to wait according to a 429's Retry-After header."""
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
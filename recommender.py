@@ -1,142 +1,377 @@
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
+from candidates import Candidates
+from diversity import mmr_rerank
+from metrics import SKIPPED, stage
+from rate_limit import RateLimiter
 
 
-def get_candidate_tracks(sp, top_artists, top_tracks, per_artist=5, per_related=3):
+TRACKS_BATCH_SIZE = 50
+# MMR re-ranks this many times `limit` of the best-scoring candidates.
+RERANK_SHORTLIST_FACTOR = 10
+
+# Score multiplier per source code (see candidates.SOURCES): favour discovery.
+# Applied after cosine scores are mapped from [-1, 1] to [0, 1], so a boost
+# always lifts a track and a penalty always lowers it.
+SOURCE_BOOST = np.array([0.8, 1.2, 1.2])
+
+
+def _album_image(track):
+    images = (track.get("album") or {}).get("images") or []
+    return images[0]["url"] if images else None
+
+
+def _candidate_row(track, artist_name, source):
+    return {
+        "id": track["id"],
+        "name": track["name"],
+        "artist": artist_name,
+        "source": source,
+        "album_image": _album_image(track),
+        "preview_url": track.get("preview_url"),
+        "hydrated": True
+    }
+
+
+def _map(fn, items, max_workers):
+    """Ordered map, run on a bounded thread pool when max_workers > 1."""
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(fn, items))
+
+
+def expand_artists(sp, artists, per_artist=5, per_related=3, max_workers=1, limiter=None, cache=None):
     """
-    Build a pool of candidate tracks from user's top artists + related artists.
-    Excludes tracks the user already listens to.
+    Candidate rows contributed by each artist: its own top tracks followed by
+    the top tracks of its related artists. Returns {artist_id: [rows]};
+    artists whose top tracks couldn't be fetched are left out.
+
+    With max_workers > 1 the API calls fan out over a thread pool that shares
+    one RateLimiter, so a 429 pauses every worker. Related artists shared by
+    several artists are fetched once.
+
+    Artist responses don't depend on the user, so they go through `cache`
+    (an ArtistCache) when one is given.
     """
-    candidates = []
+    limiter = limiter or RateLimiter()
+
+    def artist_top_tracks(artist_id):
+        def load():
+            return limiter.call(sp.artist_top_tracks, artist_id, country="US")
+        if cache is None:
+            return load()
+        return cache.get_or_fetch(("top_tracks", artist_id, "US"), load)
 
- 
-    user_track_ids = {t["id"] for t in top_tracks if "id" in t}
+    def artist_related_artists(artist_id):
+        def load():
+            return limiter.call(sp.artist_related_artists, artist_id)
+        if cache is None:
+            return load()
+        return cache.get_or_fetch(("related_artists", artist_id), load)
 
-    for artist in top_artists:
+    def fetch_artist(artist):
+        try:
+            tracks = artist_top_tracks(artist["id"])["tracks"][:per_artist]
+        except Exception:
+            SKIPPED.inc("artist_top_tracks")
+            return None
         try:
-            artist_id = artist["id"]
-
-            
-            top_tracks_artist = sp.artist_top_tracks(artist_id, country="US")["tracks"][:per_artist]
-            for track in top_tracks_artist:
-                if track["id"] not in user_track_ids:
-                    candidates.append({
-                        "id": track["id"],
-                        "name": track["name"],
-                        "artist": artist["name"],
-                        "source": "top_artist"
-                    })
-
-           
-            related = sp.artist_related_artists(artist_id)["artists"][:per_related]
-            for rel in related:
-                try:
-                    rel_tracks = sp.artist_top_tracks(rel["id"], country="US")["tracks"][:2]
-                    for track in rel_tracks:
-                        if track["id"] not in user_track_ids:
-                            candidates.append({
-                                "id": track["id"],
-                                "name": track["name"],
-                                "artist": rel["name"],
-                                "source": "related_artist"
-                            })
-                except Exception:
-                    continue
+            related = artist_related_artists(artist["id"])["artists"][:per_related]
+        except Exception:
+            SKIPPED.inc("related_artists")
+            related = []
+        return tracks, related
 
+    def fetch_related(artist_id):
+        try:
+            return artist_top_tracks(artist_id)["tracks"][:2]
         except Exception:
+            SKIPPED.inc("related_top_tracks")
+            return None
+
+    expanded = _map(fetch_artist, artists, max_workers)
+
+    related_ids = list(dict.fromkeys(
+        rel["id"] for result in expanded if result for rel in result[1]
+    ))
+    related_tracks = dict(zip(related_ids, _map(fetch_related, related_ids, max_workers)))
+
+    rows_by_artist = {}
+    for artist, result in zip(artists, expanded):
+        if result is None:
             continue
+        tracks, related = result
+
+        rows = [_candidate_row(track, artist["name"], "top_artist") for track in tracks]
+        for rel in related:
+            for track in related_tracks.get(rel["id"]) or []:
+                rows.append(_candidate_row(track, rel["name"], "related_artist"))
+        rows_by_artist[artist["id"]] = rows
+
+    return rows_by_artist
+
+
+def assemble_candidates(top_artists, rows_by_artist, exclude_ids=()):
+    """
+    Candidates from per-artist rows, in top-artist order, skipping
+    `exclude_ids`. The first occurrence of a track wins.
+    """
+    exclude_ids = set(exclude_ids)
+    return Candidates.from_rows(
+        row
+        for artist in top_artists
+        for row in rows_by_artist.get(artist["id"], ())
+        if row["id"] not in exclude_ids
+    )
+
+
+def get_candidate_tracks(sp, top_artists, top_tracks, per_artist=5, per_related=3,
+                         max_workers=1, limiter=None, cache=None):
+    """
+    Build a pool of candidate tracks from user's top artists + related artists.
+    Excludes tracks the user already listens to.
+    See expand_artists for concurrency and caching.
+    """
+    rows_by_artist = expand_artists(sp, top_artists, per_artist=per_artist, per_related=per_related,
+                                    max_workers=max_workers, limiter=limiter, cache=cache)
+    user_track_ids = [t["id"] for t in top_tracks if "id" in t]
+    return assemble_candidates(top_artists, rows_by_artist, exclude_ids=user_track_ids)
+
+
+def taste_vector(top_tracks, store):
+    """
+    Mean of the user's top-track feature vectors (not normalised).
+    Since stored vectors are unit length, a candidate's dot product with this
+    mean is its mean cosine similarity to the top tracks.
+    """
+    vecs, found = store.vectors([t["id"] for t in top_tracks if "id" in t])
+    if not found.any():
+        return None
+    return vecs[found].mean(axis=0)
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first, without a full sort."""
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def score_candidates(top_tracks, candidates, store=None, known_scores=None, scored=None):
+    """
+    Score every candidate by cosine similarity of audio features to the
+    user's taste, into `candidates.scores` (also returned).
+    Needs a FeatureStore holding vectors for the tracks; anything without
+    features scores 0. Without a store every candidate scores 0.
+
+    `known_scores` ({track_id: score}, computed against the same taste) lets
+    unchanged candidates skip re-scoring. A `scored` dict, if given, is filled with
+    {track_id: score} for the candidates that had features (reused or newly
+    scored). Only those are safe to pass back as `known_scores`: a 0 from
+    missing features would stick once the features arrive.
+    """
+    scores = np.zeros(len(candidates), dtype=np.float32)
+    centroid = taste_vector(top_tracks, store) if store is not None else None
+    if centroid is not None:
+        known_scores = known_scores or {}
+        todo = np.array([t not in known_scores for t in candidates.ids], dtype=bool)
+        for i in np.flatnonzero(~todo):
+            scores[i] = known_scores[candidates.ids[i]]
+        if todo.any():
+            cand_vecs, found = store.vectors([candidates.ids[i] for i in np.flatnonzero(todo)])
+            scores[todo] = cand_vecs @ centroid
+        if scored is not None:
+            scored.update((candidates.ids[i], float(scores[i])) for i in np.flatnonzero(~todo))
+            if todo.any():
+                scored.update((candidates.ids[i], float(scores[i])) for i in np.flatnonzero(todo)[found])
+
+    candidates.scores = scores
+    return scores
 
-   
-    df = pd.DataFrame(candidates)
-    if not df.empty:
-        df = df.drop_duplicates(subset=["id"])
-    return df
 
+def recommend_tracks(top_tracks, candidates, top_n=10, store=None, known_scores=None, scored=None):
+    """
+    The `top_n` candidates most similar to the user's taste, best first.
+    See score_candidates for the scoring and its arguments.
+    """
+    if candidates is None or len(candidates) == 0:
+        return Candidates.empty()
+    scores = score_candidates(top_tracks, candidates, store=store, known_scores=known_scores, scored=scored)
+    return candidates.take(top_k(scores, top_n))
 
 
-def recommend_tracks(top_tracks, candidates, top_n=10):
+def hydrate_tracks(sp, recs):
     """
-    Recommend tracks using cosine similarity on dummy vectors (stand-in for audio features).
+    Fill in album art and preview URLs for rows that don't carry them yet.
+    Candidates built from artist top tracks already have both, so this only
+    hits the API for the leftovers, batched through the multi-track endpoint.
+    Rows that still can't be hydrated are dropped.
     """
-    if candidates is None or candidates.empty:
-        return pd.DataFrame()
+    missing = np.flatnonzero(~recs.hydrated)
+    if len(missing) == 0:
+        return recs
 
-   
-    rng = np.random.default_rng(seed=42)
-    track_vecs = rng.random((len(top_tracks), 10))
-    cand_vecs = rng.random((len(candidates), 10))
+    ids = [recs.ids[i] for i in missing]
+    fetched = {}
+    for i in range(0, len(ids), TRACKS_BATCH_SIZE):
+        try:
+            tracks = sp.tracks(ids[i:i + TRACKS_BATCH_SIZE])["tracks"]
+        except Exception:
+            SKIPPED.inc("hydrate")
+            continue
+        for track in tracks:
+            if track:
+                fetched[track["id"]] = track
 
-    sims = cosine_similarity(track_vecs, cand_vecs)
-    scores = sims.mean(axis=0)
+    keep = recs.hydrated.copy()
+    for i in missing:
+        track = fetched.get(recs.ids[i])
+        if track is None:
+            continue
+        recs.album_images[i] = _album_image(track)
+        recs.preview_urls[i] = track.get("preview_url")
+        recs.hydrated[i] = True
+        keep[i] = True
 
-    candidates = candidates.copy()
-    candidates["similarity"] = scores
-    return candidates.sort_values("similarity", ascending=False).head(top_n)
+    return recs if keep.all() else recs.take(keep)
 
 
-def get_recommendations(sp, top_tracks, top_artists, limit=50):
+def get_recommendations(sp, top_tracks, top_artists, limit=50, max_workers=8, cache=None,
+                        store=None, catalog=None, catalog_min=None, pools=None, user_id=None,
+                        pool_view="", diversity=0.7, per_artist_cap=3, limiter=None):
     """
     Generate up to `limit` fresh recommendations:
     - Pulls user's top tracks (all ranges) + recently played
-    - Expands candidates with top + related artists
+    - Looks up tracks near the user's taste in the catalog index (if given)
+    - Expands candidates with top + related artists and merges in the
+      catalog hits
     - Filters out songs the user already knows
-    - Ranks & boosts variety
+    - Ranks, boosts discovery sources, then re-ranks the best
+      `limit * RERANK_SHORTLIST_FACTOR` for variety with MMR
+      (`diversity` is the MMR lambda: 1.0 ranks purely by score) and at
+      most `per_artist_cap` tracks per artist (None for no cap)
+
+    With `pools` (a CandidatePoolStore) and `user_id`, the per-artist
+    candidate rows and scores are persisted per `pool_view` (the top list
+    `top_artists` came from, e.g. "short_term:10"): later calls for that view
+    only expand artists that are new in `top_artists`, drop those that left,
+    and re-score only new rows while the user's taste vector is unchanged. For such a returning
+    user, the new artists aren't expanded either when the catalog already
+    returned `catalog_min` (default limit * 3) candidates.
+
+    Pass a process-wide `limiter` (RateLimiter) so concurrent jobs back off
+    together on a 429; otherwise each call gets its own.
     """
+    limiter = limiter or RateLimiter()
 
     user_track_ids = set()
 
-    for rng in ["short_term", "medium_term", "long_term"]:
+    with stage("history"):
+        for rng in ["short_term", "medium_term", "long_term"]:
+            try:
+                history = sp.current_user_top_tracks(limit=50, time_range=rng)["items"]
+                user_track_ids.update([t["id"] for t in history if "id" in t])
+            except Exception:
+                SKIPPED.inc("history")
+                continue
+
         try:
-            history = sp.current_user_top_tracks(limit=50, time_range=rng)["items"]
-            user_track_ids.update([t["id"] for t in history if "id" in t])
+            recent = sp.current_user_recently_played(limit=50)["items"]
+            user_track_ids.update([r["track"]["id"] for r in recent if "track" in r and "id" in r["track"]])
         except Exception:
-            continue
+            SKIPPED.inc("recently_played")
 
-   
-    try:
-        recent = sp.current_user_recently_played(limit=50)["items"]
-        user_track_ids.update([r["track"]["id"] for r in recent if "track" in r and "id" in r["track"]])
-    except Exception:
-        
-        pass
+        user_track_ids.update([t["id"] for t in top_tracks if "id" in t])
 
-    
-    user_track_ids.update([t["id"] for t in top_tracks if "id" in t])
+    centroid = None
+    catalog_candidates = []
+    with stage("catalog"):
+        if store is not None:
+            store.ensure(sp, [t["id"] for t in top_tracks if "id" in t], limiter=limiter)
+            centroid = taste_vector(top_tracks, store)
+        if catalog is not None and centroid is not None:
+            catalog_candidates = catalog.search(centroid, k=limit * 3, exclude=user_track_ids)
 
-    
-    candidates = get_candidate_tracks(sp, top_artists, top_tracks, per_artist=15, per_related=20)
+    pool = None
+    rows_by_artist = None
+    known_scores = None
+    scored = {}
+    with stage("candidates"):
+        if catalog_min is None:
+            catalog_min = limit * 3
+        if pools is not None and user_id:
+            pool = pools.load(user_id, view=pool_view)
+            rows_by_artist = pool["artists"] if pool else {}
+            current = {a["id"] for a in top_artists}
+            rows_by_artist = {a: rows for a, rows in rows_by_artist.items() if a in current}
+            new_artists = [a for a in top_artists if a["id"] not in rows_by_artist]
+            # Only a returning user's new artists can be covered by the catalog;
+            # a first visit always expands the user's own artists.
+            if pool is None or catalog is None or len(catalog_candidates) < catalog_min:
+                rows_by_artist.update(expand_artists(sp, new_artists, per_artist=15, per_related=20,
+                                                     max_workers=max_workers, limiter=limiter, cache=cache))
+            candidates = assemble_candidates(top_artists, rows_by_artist,
+                                             exclude_ids=[t["id"] for t in top_tracks if "id" in t])
+            if pool and centroid is not None and pool["centroid"] is not None and \
+                    np.array_equal(np.asarray(pool["centroid"], dtype=np.float32), centroid):
+                known_scores = pool["scores"]
+        else:
+            candidates = get_candidate_tracks(sp, top_artists, top_tracks, per_artist=15, per_related=20,
+                                              max_workers=max_workers, limiter=limiter, cache=cache)
 
-   
-    candidates = candidates[~candidates["id"].isin(user_track_ids)]
+    with stage("filter"):
+        if catalog_candidates:
+            candidates = candidates.concat(Candidates.from_rows(catalog_candidates))
+        candidates = candidates.exclude(user_track_ids)
 
-    if candidates.empty:
+    if len(candidates) == 0:
         return []
 
-  
-    recs = recommend_tracks(top_tracks, candidates, top_n=limit * 3)
+    with stage("features"):
+        if store is not None:
+            store.ensure(sp, candidates.ids, limiter=limiter)
+        if catalog is not None:
+            catalog.add(candidates.rows())
+
+    with stage("scoring"):
+        scores = score_candidates(top_tracks, candidates, store=store,
+                                  known_scores=known_scores, scored=scored)
+        scores = (scores + 1) / 2 * SOURCE_BOOST[candidates.source_codes]
+        # MMR only needs the head of the ranking; shortlist it without a full sort.
+        shortlist = top_k(scores, limit * RERANK_SHORTLIST_FACTOR)
+        recs = candidates.take(shortlist)
+        recs.scores = scores[shortlist]
+
+    with stage("rerank"):
+        if store is not None:
+            vecs, _ = store.vectors(recs.ids)
+        else:
+            vecs = np.zeros((len(recs), 1), dtype=np.float32)
+        recs = recs.take(mmr_rerank(vecs, recs.scores, limit, lam=diversity,
+                                    artist_codes=recs.artist_codes, per_artist=per_artist_cap))
 
-    
-    recs["similarity"] *= recs["source"].apply(lambda s: 0.8 if s == "top_artist" else 1.2)
+    if rows_by_artist is not None:
+        pools.save(user_id, rows_by_artist, centroid, scored,
+                   built_at=pool["built_at"] if pool else None, view=pool_view)
 
-    recs = recs.sort_values("similarity", ascending=False).head(limit)
+    with stage("hydration"):
+        recs = hydrate_tracks(sp, recs)
 
-   
     result = []
-    for _, row in recs.iterrows():
-        try:
-            track_data = sp.track(row["id"])
-            result.append({
-                "id": row["id"],
-                "name": row["name"],
-                "artist": row["artist"],
-                "score": float(row["similarity"]),
-                "album_image": track_data["album"]["images"][0]["url"] if track_data["album"]["images"] else None,
-                "preview_url": track_data.get("preview_url"),
-                "source": row.get("source", "unknown")
-            })
-        except Exception:
-            continue
+    for row in recs.rows():
+        result.append({
+            "id": row["id"],
+            "name": row["name"],
+            "artist": row["artist"],
+            "score": row["similarity"],
+            "album_image": row["album_image"],
+            "preview_url": row["preview_url"],
+            "source": row["source"]
+        })
 
     return result
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Spotify's max page size for the personal top-N endpoints. Top-N calls are
+# always fetched at this size so any smaller request can be sliced from it.
+TOP_N_FETCH_LIMIT = 50
+TOP_N_METHODS = {
+    "current_user_top_tracks",
+    "current_user_top_artists",
+    "current_user_recently_played",
+}
+# Only read-only calls are memoized; anything else passes straight through.
+MEMOIZED_METHODS = TOP_N_METHODS | {
+    "current_user",
+    "artist",
+    "artists",
+    "artist_top_tracks",
+    "artist_related_artists",
+    "track",
+    "tracks",
+    "audio_features",
+}
+
+
+class MemoizingSpotify:
+    """
+    Wraps a spotipy.Spotify so identical read calls are made only once.
+
+    One instance is meant to live for a single request (see `get_spotify` in
+    app.py). Passing a `memo` from SessionMemo lets results carry over between
+    a user's requests for a short TTL.
+    """
+
+    def __init__(self, sp, memo=None):
+        self.sp = sp
+        self._memo = memo if memo is not None else {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.sp, name)
+        if name not in MEMOIZED_METHODS or not callable(attr):
+            return attr
+        if name in TOP_N_METHODS:
+            return lambda *args, **kwargs: self._top_n(name, *args, **kwargs)
+        return lambda *args, **kwargs: self._call(name, args, kwargs)
+
+    def _top_n(self, name, limit=20, offset=0, **kwargs):
+        if offset or limit > TOP_N_FETCH_LIMIT:
+            if offset:
+                kwargs["offset"] = offset
+            return self._call(name, (), dict(kwargs, limit=limit))
+        response = self._call(name, (), dict(kwargs, limit=TOP_N_FETCH_LIMIT))
+        if limit >= len(response["items"]):
+            return response
+        return dict(response, items=response["items"][:limit], limit=limit)
+
+    def _call(self, name, args, kwargs):
+        key = (name, _freeze(args), _freeze(kwargs))
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent callers of the same resource wait for the first one.
+        with key_lock:
+            if key in self._memo:
+                return self._memo[key]
+            value = getattr(self.sp, name)(*args, **kwargs)
+            self._memo[key] = value
+            return value
+
+
+class SessionMemo:
+    """
+    Per-session memo tables, kept in-process for `ttl` seconds after creation.
+    Bounded to `max_sessions`, oldest dropped first.
+    """
+
+    def __init__(self, ttl=60, max_sessions=1000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def for_session(self, session_id):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] <= now:
+                entry = (now + self.ttl, {})
+                self._sessions[session_id] = entry
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return entry[1]
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
@@ -0,0 +1,26 @@
+import sqlite3
+import threading
+
+
+class LocalConnection:
+    """
+    Callable returning this thread's sqlite3 connection to `path`, opening it
+    on first use. sqlite3 connections can't be shared between threads, so
+    every SQLite-backed store keeps one per thread through this, with the
+    same settings: autocommit, WAL journal (readers don't block the writer,
+    and all workers can share the file) and synchronous=NORMAL.
+    """
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,156 @@
+import json
+import threading
+import time
+
+from spotipy.exceptions import SpotifyOauthError
+
+from sqlite_store import LocalConnection
+
+
+DEFAULT_SESSION_TTL = 30 * 24 * 60 * 60
+# Refresh access tokens this many seconds before Spotify says they expire.
+REFRESH_MARGIN = 120
+
+
+class TokenStore:
+    """
+    Server-side store for Spotify token_info dicts, keyed by session ID.
+    The Flask cookie only carries the session ID.
+
+    Entries expire `ttl` seconds after they were last written (login or
+    refresh). Subclasses implement _load/_save/delete/purge_expired.
+    """
+
+    def __init__(self, ttl=DEFAULT_SESSION_TTL, refresh_margin=REFRESH_MARGIN):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+
+    def get(self, session_id):
+        """The stored token_info for `session_id`, or None."""
+        if not session_id:
+            return None
+        return self._load(session_id, time.time())
+
+    def set(self, session_id, token_info):
+        self._save(session_id, token_info, time.time() + self.ttl)
+
+    def get_fresh(self, session_id, oauth_factory):
+        """
+        Like get(), but refreshes the access token through a SpotifyOAuth from
+        `oauth_factory()` when it is expired or about to be.
+
+        If Spotify rejects the refresh token, the session is forgotten and None
+        returned. Any other refresh failure (network error, 429, 5xx) keeps the
+        session: the old token is returned while it is still valid, else None.
+        """
+        token_info = self.get(session_id)
+        if token_info is None:
+            return None
+        expires_in = token_info.get("expires_at", 0) - time.time()
+        if expires_in > self.refresh_margin:
+            return token_info
+        try:
+            refreshed = oauth_factory().refresh_access_token(token_info["refresh_token"])
+        except Exception as e:
+            if refresh_rejected(e):
+                self.delete(session_id)
+                return None
+            return token_info if expires_in > 0 else None
+        # Spotify doesn't always send a new refresh token; keep the old one then.
+        refreshed.setdefault("refresh_token", token_info["refresh_token"])
+        self.set(session_id, refreshed)
+        return refreshed
+
+
+def refresh_rejected(error):
+    """
+    True if a refresh_access_token error means the refresh token itself is no
+    good (revoked, expired, malformed), as opposed to a transient failure.
+    """
+    if not isinstance(error, SpotifyOauthError):
+        return False
+    if error.error == "invalid_grant":
+        return True
+    # spotipy raises SpotifyOauthError from the requests HTTPError.
+    response = getattr(error.__context__, "response", None)
+    return getattr(response, "status_code", None) == 400
+
+
+class MemoryTokenStore(TokenStore):
+    """In-process store. Only suitable for a single worker process."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def _load(self, session_id, now):
+        with self._lock:
+            entry = self._tokens.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._tokens[session_id]
+                return None
+            return dict(entry[1])
+
+    def _save(self, session_id, token_info, expires_at):
+        with self._lock:
+            self._tokens[session_id] = (expires_at, dict(token_info))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._tokens.pop(session_id, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (expires_at, _) in self._tokens.items() if expires_at <= now]
+            for key in expired:
+                del self._tokens[key]
+        return len(expired)
+
+
+class SQLiteTokenStore(TokenStore):
+    """SQLite-backed store (WAL mode), shared by all workers on the host."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._db = LocalConnection(path)
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " session_id TEXT PRIMARY KEY, token_info TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db().execute("CREATE INDEX IF NOT EXISTS tokens_expires_at ON tokens (expires_at)")
+        self.purge_expired()
+
+    def _load(self, session_id, now):
+        row = self._db().execute(
+            "SELECT token_info FROM tokens WHERE session_id = ? AND expires_at > ?",
+            (session_id, now)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, session_id, token_info, expires_at):
+        self._db().execute(
+            "INSERT OR REPLACE INTO tokens (session_id, token_info, expires_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(token_info), expires_at)
+        )
+
+    def delete(self, session_id):
+        self._db().execute("DELETE FROM tokens WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self):
+        return self._db().execute(
+            "DELETE FROM tokens WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+
+
+def create_token_store(backend, path=None, **kwargs):
+    """Build the store named by `backend` ("memory" or "sqlite")."""
+    if backend == "memory":
+        return MemoryTokenStore(**kwargs)
+    if backend == "sqlite":
+        return SQLiteTokenStore(path, **kwargs)
+    raise ValueError(f"unknown token store backend: {backend!r}")